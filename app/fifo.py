@@ -1,16 +1,18 @@
-﻿from dataclasses import dataclass
+﻿from bisect import bisect_right
+from dataclasses import dataclass
+from operator import attrgetter
 from typing import Dict, List, Set, Tuple
 
 from .parser import Trade
 
 
-@dataclass
+@dataclass(slots=True)
 class Lot:
     qty: float
     cost: float  # cost per share
 
 
-@dataclass
+@dataclass(slots=True)
 class Realized:
     gain: float = 0.0
     loss: float = 0.0
@@ -18,7 +20,7 @@ class Realized:
     cost: float = 0.0
 
 
-@dataclass
+@dataclass(slots=True)
 class WarningMsg:
     symbol: str
     message: str
@@ -41,58 +43,76 @@ def compute_realized(
     initial_lots: Dict[str, List[Lot]],
     fallback_costs: Dict[str, float],
     target_year: int | None = None,
+    presorted: bool = False,
 ) -> Tuple[Dict[str, Realized], List[WarningMsg], Set[str], Set[str]]:
-    positions: Dict[str, List[Lot]] = {sym: list(lots) for sym, lots in initial_lots.items()}
     realized: Dict[str, Realized] = {}
     warnings: List[WarningMsg] = []
     missing_cost_symbols: Set[str] = set()
     sold_symbols: Set[str] = set()
 
-    trades_sorted = sorted(trades, key=lambda t: t.trade_date)
+    trades_sorted = trades if presorted else sorted(trades, key=attrgetter("trade_date"))
+    if target_year is not None:
+        # Trades after the target year only append or consume later lots, so
+        # they cannot change that year's realized results; drop them up front.
+        end = bisect_right(trades_sorted, target_year, key=attrgetter("trade_date.year"))
+        trades_sorted = trades_sorted[:end]
+    # FIFO matching is independent per symbol, so bucket once (keeping date
+    # order within each symbol) and walk each symbol against its own lots.
+    by_symbol: Dict[str, List[Trade]] = {}
     for trade in trades_sorted:
-        sym = trade.symbol
-        if sym not in positions:
-            positions[sym] = []
-        if sym not in realized:
-            realized[sym] = Realized()
-
-        if trade.side == "BUY":
-            positions[sym].append(Lot(qty=trade.qty, cost=trade.price))
-            continue
-
-        if target_year is None or trade.trade_date.year == target_year:
-            sold_symbols.add(sym)
-
-        remaining = trade.qty
-        lots = positions[sym]
-        while remaining > 1e-9 and lots:
-            lot = lots[0]
-            take = min(remaining, lot.qty)
-            if target_year is None or trade.trade_date.year == target_year:
-                _add_realized(realized[sym], (trade.price - lot.cost) * take)
-                _add_proceeds_cost(realized[sym], trade.price * take, lot.cost * take)
-            lot.qty -= take
-            remaining -= take
-            if lot.qty <= 1e-9:
-                lots.pop(0)
-
-        if remaining > 1e-9:
-            fallback = fallback_costs.get(sym)
-            if fallback is None:
-                warnings.append(
-                    WarningMsg(
-                        symbol=sym,
-                        message=(
-                            "Sell quantity exceeds available lots and no year-start average cost provided. "
-                            "Used 0 cost for remaining shares."
-                        ),
+        by_symbol.setdefault(trade.symbol, []).append(trade)
+
+    for sym, sym_trades in by_symbol.items():
+        # Open lots are kept as parallel qty/cost columns; `head` points at the
+        # oldest lot still open, so exhausted lots are skipped, never popped.
+        start_lots = initial_lots.get(sym, [])
+        lot_qty = [lot.qty for lot in start_lots]
+        lot_cost = [lot.cost for lot in start_lots]
+        head = 0
+        sym_realized = realized[sym] = Realized()
+        for trade in sym_trades:
+            if trade.side == "BUY":
+                lot_qty.append(trade.qty)
+                lot_cost.append(trade.price)
+                continue
+
+            in_year = target_year is None or trade.trade_date.year == target_year
+            if in_year:
+                sold_symbols.add(sym)
+
+            price = trade.price
+            remaining = trade.qty
+            while remaining > 1e-9 and head < len(lot_qty):
+                open_qty = lot_qty[head]
+                cost = lot_cost[head]
+                take = min(remaining, open_qty)
+                if in_year:
+                    _add_realized(sym_realized, (price - cost) * take)
+                    _add_proceeds_cost(sym_realized, price * take, cost * take)
+                open_qty -= take
+                remaining -= take
+                if open_qty <= 1e-9:
+                    head += 1
+                else:
+                    lot_qty[head] = open_qty
+
+            if remaining > 1e-9:
+                fallback = fallback_costs.get(sym)
+                if fallback is None:
+                    warnings.append(
+                        WarningMsg(
+                            symbol=sym,
+                            message=(
+                                "Sell quantity exceeds available lots and no year-start average cost provided. "
+                                "Used 0 cost for remaining shares."
+                            ),
+                        )
                     )
-                )
-                missing_cost_symbols.add(sym)
-                fallback = 0.0
-            if target_year is None or trade.trade_date.year == target_year:
-                _add_realized(realized[sym], (trade.price - fallback) * remaining)
-                _add_proceeds_cost(realized[sym], trade.price * remaining, fallback * remaining)
-            remaining = 0.0
+                    missing_cost_symbols.add(sym)
+                    fallback = 0.0
+                if in_year:
+                    _add_realized(sym_realized, (price - fallback) * remaining)
+                    _add_proceeds_cost(sym_realized, price * remaining, fallback * remaining)
+                remaining = 0.0
 
     return realized, warnings, missing_cost_symbols, sold_symbols
@@ -1,23 +1,141 @@
-﻿import csv
+﻿import asyncio
+import csv
+import hashlib
 import io
+import multiprocessing
 import os
+import shutil
 import tempfile
-from typing import Dict, List, Optional, Tuple
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from operator import attrgetter
+from typing import BinaryIO, DefaultDict, Dict, Iterator, List, Optional, Tuple
 from uuid import uuid4
 
 from fastapi import FastAPI, File, Form, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 
 from .fifo import Lot, WarningMsg, compute_realized
 from .parser import Holding, Trade, parse_pdf
 from .report import SummaryRow, WarningRow, build_workbook
 
-app = FastAPI()
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    yield
+    _shutdown_parse_pool()
+
+
+app = FastAPI(lifespan=_lifespan)
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
-REPORT_STORE: Dict[str, str] = {}
+# token -> (xlsx path, created at); oldest first, so expiry only checks the head.
+REPORT_STORE: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+REPORT_STORE_MAX = 256
+REPORT_TTL_SECONDS = 3600
+_REPORT_LOCK = threading.Lock()
+UPLOAD_CHUNK_SIZE = 1 << 20
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+_TRUTHY = frozenset({"true", "on", "1", "yes"})
+_HEADER_COLS = frozenset({"symbol", "currency"})
+_ACCOUNT_COLS = frozenset({"account", "account_id"})
+_PARSE_POOL: Optional[ProcessPoolExecutor] = None
+# Each worker holds a full pdfplumber parse in memory; keep the pool small.
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+
+ParsedStatement = Tuple[Optional[Tuple[int, int]], List[Trade], List[Holding], str]
+# sha256 of the uploaded PDF -> parse_pdf result, least recently used first.
+_PARSE_CACHE: "OrderedDict[str, ParsedStatement]" = OrderedDict()
+PARSE_CACHE_MAX = 128
+
+
+def _parse_pool() -> ProcessPoolExecutor:
+    # PDF text extraction is CPU-bound pure Python, so statements are parsed
+    # in worker processes; the pool is created once and reused across requests.
+    # Workers come from a forkserver rather than forking the threaded server
+    # process, and are started on demand instead of all at the first submit.
+    global _PARSE_POOL
+    if _PARSE_POOL is None:
+        _PARSE_POOL = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    return _PARSE_POOL
+
+
+def _discard_parse_pool(pool: ProcessPoolExecutor) -> None:
+    # Only the failed pool is dropped; another request may already have replaced it.
+    global _PARSE_POOL
+    if _PARSE_POOL is pool:
+        _PARSE_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_parses(pool: ProcessPoolExecutor, paths: List[str]) -> "asyncio.Future[List[ParsedStatement]]":
+    loop = asyncio.get_running_loop()
+    return asyncio.gather(*(loop.run_in_executor(pool, parse_pdf, path) for path in paths))
+
+
+async def _run_parse_pool(paths: List[str]) -> List[ParsedStatement]:
+    pool = _parse_pool()
+    try:
+        return await _submit_parses(pool, paths)
+    except BrokenProcessPool:
+        # A worker died abruptly (e.g. a native crash while reading a PDF),
+        # which breaks the whole pool; replace it and retry once.
+        _discard_parse_pool(pool)
+    pool = _parse_pool()
+    try:
+        return await _submit_parses(pool, paths)
+    except BrokenProcessPool:
+        _discard_parse_pool(pool)
+        raise
+
+
+def _save_upload(src: BinaryIO, dst: BinaryIO) -> str:
+    # Copy in chunks and hash on the way through, so the cache key costs no extra read.
+    digest = hashlib.sha256()
+    while chunk := src.read(UPLOAD_CHUNK_SIZE):
+        digest.update(chunk)
+        dst.write(chunk)
+    return digest.hexdigest()
+
+
+async def _parse_statements(paths: List[str], digests: List[str]) -> List[ParsedStatement]:
+    results: Dict[str, ParsedStatement] = {}
+    pending: Dict[str, str] = {}
+    for path, digest in zip(paths, digests):
+        if digest in results or digest in pending:
+            continue
+        cached = _PARSE_CACHE.get(digest)
+        if cached is not None:
+            _PARSE_CACHE.move_to_end(digest)
+            results[digest] = cached
+        else:
+            pending[digest] = path
+
+    for digest, result in zip(pending, await _run_parse_pool(list(pending.values()))):
+        results[digest] = result
+        _PARSE_CACHE[digest] = result
+        if len(_PARSE_CACHE) > PARSE_CACHE_MAX:
+            _PARSE_CACHE.popitem(last=False)
+
+    return [results[digest] for digest in digests]
+
+
+def _shutdown_parse_pool() -> None:
+    global _PARSE_POOL
+    if _PARSE_POOL is not None:
+        _PARSE_POOL.shutdown()
+        _PARSE_POOL = None
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -32,6 +150,52 @@ def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request, **defaults})
 
 
+def _discard_report(path: str) -> None:
+    # Each report sits in its own per-request temp dir next to the uploads.
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def _expire_reports(now: float) -> None:
+    while REPORT_STORE:
+        token, (path, created) = next(iter(REPORT_STORE.items()))
+        if now - created < REPORT_TTL_SECONDS:
+            break
+        del REPORT_STORE[token]
+        _discard_report(path)
+
+
+def _store_report(path: str) -> str:
+    token = uuid4().hex
+    now = time.monotonic()
+    with _REPORT_LOCK:
+        _expire_reports(now)
+        REPORT_STORE[token] = (path, now)
+        while len(REPORT_STORE) > REPORT_STORE_MAX:
+            _, (old_path, _) = REPORT_STORE.popitem(last=False)
+            _discard_report(old_path)
+    return token
+
+
+def _open_report(token: str) -> Optional[BinaryIO]:
+    # Opened under the lock: a concurrent _store_report may evict the entry and
+    # delete its directory, but an already open handle stays readable.
+    with _REPORT_LOCK:
+        _expire_reports(time.monotonic())
+        entry = REPORT_STORE.get(token)
+        if entry is None:
+            return None
+        try:
+            return open(entry[0], "rb")
+        except FileNotFoundError:
+            return None
+
+
+def _iter_file(f: BinaryIO) -> Iterator[bytes]:
+    with f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+
 def _parse_fx_rates(usd_rate: str, hkd_rate: str, sgd_rate: str) -> Dict[str, float]:
     rates: Dict[str, float] = {}
     try:
@@ -54,14 +218,17 @@ def _parse_avg_costs(file: Optional[UploadFile]) -> Dict[Tuple[str, str, str], f
         return {}
     content = file.file.read()
     text = content.decode("utf-8", errors="ignore")
-    reader = csv.reader(io.StringIO(text))
-    rows = list(reader)
+    if '"' in text:
+        rows = list(csv.reader(io.StringIO(text)))
+    else:
+        # Without quoting a plain split is equivalent and skips the csv machinery.
+        rows = [line.split(",") for line in text.splitlines() if line.strip()]
     if not rows:
         return {}
     start_idx = 0
     header = [c.strip().lower() for c in rows[0]]
-    has_header = "symbol" in header and "currency" in header
-    has_account = "account" in header or "account_id" in header
+    has_header = _HEADER_COLS.issubset(header)
+    has_account = not _ACCOUNT_COLS.isdisjoint(header)
     if has_header:
         start_idx = 1
     costs: Dict[Tuple[str, str, str], float] = {}
@@ -83,6 +250,7 @@ def _parse_avg_costs(file: Optional[UploadFile]) -> Dict[Tuple[str, str, str], f
     return costs
 
 
+@lru_cache(maxsize=4096)
 def _normalize_symbol(symbol: str) -> str:
     return symbol.strip().upper().replace("*", "")
 
@@ -97,20 +265,23 @@ def _cost_lookup(
     symbol: str,
     currency: str,
 ) -> Optional[float]:
-    return costs.get((account_id, symbol, currency)) or costs.get(("*", symbol, currency))
+    cost = costs.get((account_id, symbol, currency))
+    if cost is None:
+        cost = costs.get(("*", symbol, currency))
+    return cost
 
 
-@app.post("/process")
-async def process(
+async def _generate_report(
     request: Request,
-    statements: List[UploadFile] = File(...),
-    avg_costs_csv: Optional[UploadFile] = File(None),
-    usd_rate: str = Form(""),
-    hkd_rate: str = Form(""),
-    sgd_rate: str = Form(""),
-    fee_rate: str = Form(""),
-    tax_floor_zero: Optional[str] = Form(None),
-    target_year: Optional[str] = Form(None),
+    statements: List[UploadFile],
+    avg_costs_csv: Optional[UploadFile],
+    usd_rate: str,
+    hkd_rate: str,
+    sgd_rate: str,
+    fee_rate: str,
+    tax_floor_zero: Optional[str],
+    target_year: Optional[str],
+    direct: bool,
 ):
     if not statements:
         return templates.TemplateResponse(
@@ -120,13 +291,18 @@ async def process(
         )
 
     tmp_dir = tempfile.mkdtemp(prefix="tax_app_")
-    parsed: List[Tuple[Optional[Tuple[int, int]], List[Trade], List[Holding], str]] = []
+    paths: List[str] = []
+    digests: List[str] = []
 
-    for f in statements:
-        path = os.path.join(tmp_dir, f.filename)
+    for i, f in enumerate(statements):
+        # Prefix with the upload index: two files may share a name, and each
+        # digest must map to the bytes actually parsed from its path.
+        path = os.path.join(tmp_dir, f"{i}_{os.path.basename(f.filename or 'statement.pdf')}")
         with open(path, "wb") as out:
-            out.write(await f.read())
-        parsed.append(parse_pdf(path))
+            digests.append(await run_in_threadpool(_save_upload, f.file, out))
+        paths.append(path)
+
+    parsed = await _parse_statements(paths, digests)
 
     months = [p[0] for p in parsed if p[0] is not None]
     if not months:
@@ -136,12 +312,12 @@ async def process(
             status_code=400,
         )
 
-    years = sorted({y for y, _ in months})
+    years = {y for y, _ in months}
     year: Optional[int] = None
     if target_year and target_year.strip().isdigit():
         year = int(target_year.strip())
     elif len(years) == 1:
-        year = years[0]
+        (year,) = years
     else:
         return templates.TemplateResponse(
             "index.html",
@@ -162,9 +338,7 @@ async def process(
         by_ref: Dict[str, Trade] = {}
         deduped: List[Trade] = []
         for t in trades:
-            ref = None
-            if ":" in t.source:
-                ref = t.source.split(":", 1)[1]
+            ref = t.source_ref
             if not ref or not ref.isdigit():
                 deduped.append(t)
                 continue
@@ -174,7 +348,7 @@ async def process(
                 continue
             # Prefer 成交单据 over 户口变动
             existing = by_ref[ref]
-            if existing.source.startswith("户口变动") and t.source.startswith("成交单据"):
+            if existing.source_kind == "户口变动" and t.source_kind == "成交单据":
                 by_ref[ref] = t
                 # replace in deduped list
                 for i, item in enumerate(deduped):
@@ -183,24 +357,31 @@ async def process(
                         break
         account_trades[account_id] = deduped
 
+    # Sort once here so compute_realized can skip its own per-call sort.
+    for trades in account_trades.values():
+        trades.sort(key=attrgetter("trade_date"))
+
     avg_costs = _parse_avg_costs(avg_costs_csv)
     rates = _parse_fx_rates(usd_rate, hkd_rate, sgd_rate)
     try:
         fee_rate_val = float(fee_rate)
     except (TypeError, ValueError):
         fee_rate_val = 0.0
+    tax_floor = str(tax_floor_zero).lower() in _TRUTHY
 
     rows: List[SummaryRow] = []
     warnings: List[WarningRow] = []
 
     for account_id, trades in account_trades.items():
         month_map = account_month_to_holdings.get(account_id, {})
-        earliest_month = sorted(month_map.keys())[0] if month_map else None
+        earliest_month = min(month_map) if month_map else None
         initial_holdings = month_map.get(earliest_month, []) if earliest_month else []
 
         fallback_costs: Dict[str, float] = {}
         initial_lots: Dict[str, List[Lot]] = {}
         cost_missing_symbols = set()
+        # Messages per symbol for this account, filled as warnings are raised.
+        warning_map: DefaultDict[str, List[str]] = defaultdict(list)
 
         name_map: Dict[str, str] = {}
         for holdings in month_map.values():
@@ -219,55 +400,54 @@ async def process(
                 initial_lots.setdefault(sym, []).append(Lot(qty=h.qty, cost=cost))
                 fallback_costs[sym] = cost
             else:
-                warnings.append(
-                    WarningRow(
-                        account_id=account_id,
-                        symbol=sym,
-                        message=(
-                            "Year-start holding detected but no average cost provided. "
-                            "If this stock is sold before new buys, a 0 cost will be used."
-                        ),
-                    )
+                warning = WarningRow(
+                    account_id=account_id,
+                    symbol=sym,
+                    message=(
+                        "Year-start holding detected but no average cost provided. "
+                        "If this stock is sold before new buys, a 0 cost will be used."
+                    ),
                 )
+                warnings.append(warning)
+                warning_map[sym].append(warning.message)
                 cost_missing_symbols.add(sym)
 
         realized, fifo_warnings, fifo_missing, sold_symbols = compute_realized(
-            trades, initial_lots, fallback_costs, target_year=year
+            trades, initial_lots, fallback_costs, target_year=year, presorted=True
         )
         cost_missing_symbols.update(fifo_missing)
         for w in fifo_warnings:
             warnings.append(WarningRow(account_id=account_id, symbol=w.symbol, message=w.message))
+            warning_map[w.symbol].append(w.message)
 
-        warning_map: Dict[str, List[str]] = {}
-        for w in warnings:
-            if w.account_id != account_id:
+        # Currency (and fallback name) come from each symbol's first trade.
+        currency_map: Dict[str, str] = {}
+        for t in trades:
+            sym = _normalize_symbol(t.symbol)
+            if sym in currency_map:
                 continue
-            warning_map.setdefault(w.symbol, []).append(w.message)
+            currency_map[sym] = t.currency
+            if not name_map.get(sym) and t.name:
+                name_map[sym] = t.name
 
         for sym, r in realized.items():
             if sym not in sold_symbols:
                 continue
-            cur = None
-            for t in trades:
-                if _normalize_symbol(t.symbol) == sym:
-                    cur = t.currency
-                    if not name_map.get(sym) and t.name:
-                        name_map[sym] = t.name
-                    break
-            if cur is None:
-                cur = ""
+            cur = currency_map.get(sym, "")
             symbol_name = name_map.get(sym, "")
             # Apply fee on proceeds
             net = (r.proceeds - r.cost) - (fee_rate_val * r.proceeds)
-            gain = net if net >= 0 else 0.0
-            loss = -net if net < 0 else 0.0
+            if net >= 0:
+                gain, loss = net, 0.0
+            else:
+                gain, loss = 0.0, -net
             tax_base = net
             tax_due = tax_base * 0.20
-            tax_floor = str(tax_floor_zero).lower() in ("true", "on", "1", "yes")
             if tax_floor and tax_due < 0:
                 tax_due = 0.0
             fx = rates.get(cur)
             if fx is None:
+                net_cny = tax_cny = None
                 warnings.append(
                     WarningRow(
                         account_id=account_id,
@@ -275,38 +455,51 @@ async def process(
                         message=f"Missing FX rate for {cur}. CNY fields left blank.",
                     )
                 )
-            net_cny = net * fx if fx is not None else None
-            tax_cny = tax_due * fx if fx is not None else None
+            else:
+                net_cny = net * fx
+                tax_cny = tax_due * fx
             rows.append(
-                SummaryRow(
-                    account_id=account_id,
-                    symbol=sym,
-                    symbol_name=symbol_name,
-                    currency=cur,
-                    proceeds=r.proceeds,
-                    cost_total=r.cost,
-                    gain=gain,
-                    loss=loss,
-                    net=net,
-                    tax_base=tax_base,
-                    tax_due=tax_due,
-                    fx_rate=fx,
-                    net_cny=net_cny,
-                    tax_cny=tax_cny,
-                    cost_missing=sym in cost_missing_symbols,
-                    cost_missing_reason="; ".join(warning_map.get(sym, [])) or None,
+                SummaryRow._make(
+                    (
+                        account_id,
+                        sym,
+                        symbol_name,
+                        cur,
+                        r.proceeds,
+                        r.cost,
+                        gain,
+                        loss,
+                        net,
+                        tax_base,
+                        tax_due,
+                        fx,
+                        net_cny,
+                        tax_cny,
+                        sym in cost_missing_symbols,
+                        "; ".join(warning_map.get(sym, [])) or None,
+                    )
                 )
             )
 
+    t_proceeds = t_cost = t_gain = t_loss = t_net = t_tax = t_net_cny = t_tax_cny = 0.0
+    for r in rows:
+        t_proceeds += r.proceeds
+        t_cost += r.cost_total
+        t_gain += r.gain
+        t_loss += r.loss
+        t_net += r.net
+        t_tax += r.tax_due
+        t_net_cny += r.net_cny or 0
+        t_tax_cny += r.tax_cny or 0
     totals = {
-        "proceeds": sum(r.proceeds for r in rows),
-        "cost_total": sum(r.cost_total for r in rows),
-        "gain": sum(r.gain for r in rows),
-        "loss": sum(r.loss for r in rows),
-        "net": sum(r.net for r in rows),
-        "tax_due": sum(r.tax_due for r in rows),
-        "net_cny": sum(r.net_cny or 0 for r in rows),
-        "tax_cny": sum(r.tax_cny or 0 for r in rows),
+        "proceeds": t_proceeds,
+        "cost_total": t_cost,
+        "gain": t_gain,
+        "loss": t_loss,
+        "net": t_net,
+        "tax_due": t_tax,
+        "net_cny": t_net_cny,
+        "tax_cny": t_tax_cny,
     }
     rows.append(
         SummaryRow(
@@ -330,11 +523,23 @@ async def process(
     )
 
     wb = build_workbook(rows, warnings)
-    out_path = os.path.join(tmp_dir, f"tax_report_{year}.xlsx")
+    filename = f"tax_report_{year}.xlsx"
+    if direct:
+        # Single-shot download: build the file in memory and drop the uploads.
+        buf = io.BytesIO()
+        wb.save(buf)
+        buf.seek(0)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return StreamingResponse(
+            buf,
+            media_type=XLSX_MEDIA_TYPE,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    out_path = os.path.join(tmp_dir, filename)
     wb.save(out_path)
 
-    token = uuid4().hex
-    REPORT_STORE[token] = out_path
+    token = _store_report(out_path)
 
     accounts = sorted({r.account_id for r in rows if r.account_id != "TOTAL"})
     return templates.TemplateResponse(
@@ -351,13 +556,68 @@ async def process(
     )
 
 
+@app.post("/process")
+async def process(
+    request: Request,
+    statements: List[UploadFile] = File(...),
+    avg_costs_csv: Optional[UploadFile] = File(None),
+    usd_rate: str = Form(""),
+    hkd_rate: str = Form(""),
+    sgd_rate: str = Form(""),
+    fee_rate: str = Form(""),
+    tax_floor_zero: Optional[str] = Form(None),
+    target_year: Optional[str] = Form(None),
+):
+    return await _generate_report(
+        request,
+        statements,
+        avg_costs_csv,
+        usd_rate,
+        hkd_rate,
+        sgd_rate,
+        fee_rate,
+        tax_floor_zero,
+        target_year,
+        direct=False,
+    )
+
+
+@app.post("/download_direct")
+async def download_direct(
+    request: Request,
+    statements: List[UploadFile] = File(...),
+    avg_costs_csv: Optional[UploadFile] = File(None),
+    usd_rate: str = Form(""),
+    hkd_rate: str = Form(""),
+    sgd_rate: str = Form(""),
+    fee_rate: str = Form(""),
+    tax_floor_zero: Optional[str] = Form(None),
+    target_year: Optional[str] = Form(None),
+):
+    return await _generate_report(
+        request,
+        statements,
+        avg_costs_csv,
+        usd_rate,
+        hkd_rate,
+        sgd_rate,
+        fee_rate,
+        tax_floor_zero,
+        target_year,
+        direct=True,
+    )
+
+
 @app.get("/download/{token}")
 def download(token: str):
-    path = REPORT_STORE.get(token)
-    if not path or not os.path.exists(path):
+    f = _open_report(token)
+    if f is None:
         return HTMLResponse("文件不存在或已过期。", status_code=404)
-    return FileResponse(
-        path,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        filename=os.path.basename(path),
+    return StreamingResponse(
+        _iter_file(f),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{os.path.basename(f.name)}"',
+            "Content-Length": str(os.fstat(f.fileno()).st_size),
+        },
     )
@@ -1,12 +1,79 @@
-﻿import re
+﻿import mmap
+import re
+import sys
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import date
-from typing import List, Optional, Tuple
+from functools import lru_cache
+from typing import Iterator, List, Optional, Sequence, Tuple
 
 import pdfplumber
 
 
-@dataclass
+# Text that identifies each broker's statement; Futu is checked first.
+_FUTU_MARKERS = ("保證金綜合帳戶", "證券月結單")
+_HUATAI_MARKERS = ("月结单", "客户户口", "成交单据", "户口变动", "持货结存")
+# Huatai sections as (start marker, end markers). parse_huatai reads only the
+# first occurrence of each, so once all have ended later pages can be skipped.
+_HUATAI_TRADE_SECTION = ("成交单据", ("户口变动", "持货结存"))
+_HUATAI_ACCOUNT_SECTION = ("户口变动", ("持货结存",))
+_HUATAI_HOLDING_SECTION = ("持货结存", ("股票借贷资料", "重要提示"))
+_HUATAI_SECTIONS = (_HUATAI_TRADE_SECTION, _HUATAI_ACCOUNT_SECTION, _HUATAI_HOLDING_SECTION)
+
+# Huatai side labels, shared by 成交单据 and 户口变动.
+_SIDE_MAP = {
+    "买入": "BUY",
+    "买入开仓": "BUY",
+    "卖出": "SELL",
+    "沽出": "SELL",
+    "卖出平仓": "SELL",
+}
+
+# Plain decimal with optional sign (commas already removed); "(x)" means negative.
+_RE_NUMERIC = re.compile(r"(?=\D*\d)(?P<paren>\()?(?P<num>[-+]?\d*(?:\.\d*)?)(?(paren)\))")
+_RE_STATEMENT_MONTH = re.compile(r"月结单\s*\((\d{4})-(\d{2})\)")
+_RE_HUATAI_CLIENT = re.compile(r"客户户口\s*:\s*(\d+)")
+_RE_HUATAI_ACCOUNT = re.compile(
+    r"^(?P<ref>\d{8,})\s+(?P<settle>\d{4}-\d{2}-\d{2})\s+"
+    r"(?P<trade>\d{4}-\d{2}-\d{2})\s+买卖交易\s+"
+    r"(?P<side>买入|沽出|卖出平仓|买入开仓|卖出)\s+(?P<code>[A-Z0-9]+:(?:HK|US))\s+"
+    r"(?P<name>.+?)\s+@(?P<price>[\d.]+)\s+(?P<qty>[\d,().-]+)"
+)
+_RE_IPO = re.compile(
+    r"^(?P<ref>[A-Z0-9]{8,})\s+(?P<settle>\d{4}-\d{2}-\d{2})"
+    r"(?:\s+\d{4}-\d{2}-\d{2})?\s+现货存入\s+"
+    r"(?P<code>\d{4,5})\s+(?P<name>.+?)\s+.*?@(?P<price>[\d.]+)\s+"
+    r"(?P<qty>[\d,]+)"
+)
+_RE_IPO_BASE = re.compile(
+    r"^(?P<ref>[A-Z0-9]{8,})\s+(?P<settle>\d{4}-\d{2}-\d{2})"
+    r"(?:\s+\d{4}-\d{2}-\d{2})?\s+现货存入\s+"
+    r"(?P<code>\d{4,5})\s+(?P<rest>.+)$"
+)
+_RE_NUMBER_TOKEN = re.compile(r"[\d,]+(?:\.\d+)?")
+_RE_TRAILING_QTY_AMOUNT = re.compile(r"[\d,]+(?:\.\d+)?\s+[\d,]+(?:\.\d+)?\s*$")
+_RE_NUM_START = re.compile(r"^[A-Z0-9]")
+_RE_OPTION_SYM = re.compile(r"\d{6,}[CP]\d{4,}")
+# A run of the same character, except digits and numeric punctuation, collapsed to one.
+# The lookahead rejects non-repeating positions before the class test runs.
+_RE_DUP = re.compile(r"(?=(.)\1)[^\d.,\-()/]\1+", re.DOTALL)
+_RE_WRAPPED = re.compile(r"(買入|賣出|賣出平倉)\s+[A-Z0-9.]+\([^)]*$")
+_RE_FUTU_ACCT = re.compile(r"[賬帳]戶號碼[:：]?\s*(\d{6,})")
+_RE_FUTU_MONTH = re.compile(r"(\d{4})/(\d{2})")
+_RE_FUTU_HEADER = re.compile(r"(買入|賣出|賣出平倉)\s+([A-Z0-9.]+)\(([^)]*)\)")
+_RE_FUTU_HEADER_PARTIAL = re.compile(r"(買入|賣出|賣出平倉)\s+([A-Z0-9.]+)\(([^)]*)$")
+_RE_FUTU_ROW = re.compile(
+    r"(SEHK|US)\s+(HKD|USD|CNH|JPY|SGD)\s+"
+    r"(\d{4}/\d{2}/\d{2})\s+(\d{4}/\d{2}/\d{2})\s+"
+    r"([\d,]+)\s+([\d.]+)\s+([\d,]+(?:\.\d+)?)"
+)
+_RE_FUTU_HOLDING = re.compile(
+    r"^([A-Z0-9.]+)\(([^)]*)\)\s+(SEHK|US)\s+(HKD|USD|CNH|JPY|SGD)\s+"
+    r"([\d,]+)\s+([\d.]+)\s+-\s+([\d,]+(?:\.\d+)?)"
+)
+
+
+@dataclass(slots=True)
 class Trade:
     account_id: str
     symbol: str
@@ -16,10 +83,17 @@ class Trade:
     side: str  # "BUY" or "SELL"
     qty: float
     price: float
-    source: str
+    # Section the row came from ("成交单据", "户口变动", "现货存入", "交易") and
+    # its reference; kept apart so the interned kind strings are shared.
+    source_kind: str
+    source_ref: str
 
+    @property
+    def source(self) -> str:
+        return f"{self.source_kind}:{self.source_ref}"
 
-@dataclass
+
+@dataclass(slots=True)
 class Holding:
     account_id: str
     symbol: str
@@ -29,19 +103,15 @@ class Holding:
 
 
 def _parse_number(token: str) -> Optional[float]:
-    token = token.replace(",", "").strip()
-    if not token:
-        return None
-    neg = token.startswith("(") and token.endswith(")")
-    if neg:
-        token = token[1:-1]
-    try:
-        val = float(token)
-    except ValueError:
+    match = _RE_NUMERIC.fullmatch(token.replace(",", "").strip())
+    if match is None:
         return None
-    return -val if neg else val
+    val = float(match.group("num"))
+    return -val if match.group("paren") else val
 
 
+# Settle/trade dates repeat heavily within a statement; date is immutable.
+@lru_cache(maxsize=2048)
 def _parse_date(token: str, fmt: str = "%Y-%m-%d") -> Optional[date]:
     try:
         if fmt == "%Y/%m/%d":
@@ -53,32 +123,94 @@ def _parse_date(token: str, fmt: str = "%Y-%m-%d") -> Optional[date]:
         return None
 
 
-def extract_text_pages(pdf_path: str) -> List[str]:
-    pages = []
-    with pdfplumber.open(pdf_path) as pdf:
+@contextmanager
+def _open_pdf(pdf_path: str) -> Iterator[pdfplumber.PDF]:
+    with open(pdf_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with pdfplumber.open(mm) as pdf:
+            yield pdf
+
+
+def _iter_pages(pdf_path: str) -> Iterator[str]:
+    # pdfplumber rebuilds lines from character positions, so tables drawn out
+    # of reading order (e.g. column by column) still come out row by row.
+    with _open_pdf(pdf_path) as pdf:
         for page in pdf.pages:
-            pages.append(page.extract_text() or "")
+            # Scanned/image-only pages have no chars; skip the text layout pass.
+            text = (page.extract_text() or "") if page.chars else ""
+            page.close()
+            yield text
+
+
+def _detect_broker(text: str) -> Optional[str]:
+    if any(marker in text for marker in _FUTU_MARKERS):
+        return "futu"
+    if any(marker in text for marker in _HUATAI_MARKERS):
+        return "huatai"
+    return None
+
+
+def _huatai_complete(text: str) -> bool:
+    # True once more pages cannot change what parse_huatai reads: the header
+    # fields are found and every section has reached its end marker.
+    return (
+        _RE_HUATAI_CLIENT.search(text) is not None
+        and _RE_STATEMENT_MONTH.search(text) is not None
+        and all(_find_section(text, start, ends)[1] >= 0 for start, ends in _HUATAI_SECTIONS)
+    )
+
+
+def extract_text_pages(pdf_path: str) -> List[str]:
+    # Pages are pulled lazily. A Huatai statement stops once all its sections
+    # have ended (trailing pages are disclosures); Futu repeats its trade
+    # sections, so a Futu statement is always read to the end.
+    pages: List[str] = []
+    broker: Optional[str] = None
+    pdf_pages = _iter_pages(pdf_path)
+    try:
+        for text in pdf_pages:
+            pages.append(text)
+            if broker is None:
+                broker = _detect_broker(text)
+            if broker == "huatai" and _huatai_complete("\n".join(pages)):
+                break
+    finally:
+        pdf_pages.close()
     return pages
 
 
 def parse_statement_month(text: str) -> Optional[Tuple[int, int]]:
-    match = re.search(r"月结单\s*\((\d{4})-(\d{2})\)", text)
+    match = _RE_STATEMENT_MONTH.search(text)
     if not match:
         return None
     return int(match.group(1)), int(match.group(2))
 
 
-def _extract_section_lines(text: str, start_marker: str, end_markers: List[str]) -> List[str]:
+@lru_cache(maxsize=8)
+def _end_marker_pattern(markers: Tuple[str, ...]) -> "re.Pattern[str]":
+    return re.compile("|".join(map(re.escape, markers)))
+
+
+def _find_section(text: str, start_marker: str, end_markers: Sequence[str]) -> Tuple[int, int]:
+    # Body bounds of the first start_marker section; start is -1 when the
+    # marker is absent and end is -1 while no end marker follows it.
     start_idx = text.find(start_marker)
+    if start_idx < 0:
+        return -1, -1
+    start_idx += len(start_marker)
+    end_idx = -1
+    if end_markers:
+        # One scan finds whichever end marker comes first.
+        match = _end_marker_pattern(tuple(end_markers)).search(text, start_idx)
+        if match:
+            end_idx = match.start()
+    return start_idx, end_idx
+
+
+def _extract_section_lines(text: str, start_marker: str, end_markers: Sequence[str]) -> List[str]:
+    start_idx, end_idx = _find_section(text, start_marker, end_markers)
     if start_idx < 0:
         return []
-    sub = text[start_idx + len(start_marker) :]
-    end_idx = len(sub)
-    for marker in end_markers:
-        idx = sub.find(marker)
-        if idx >= 0:
-            end_idx = min(end_idx, idx)
-    section = sub[:end_idx]
+    section = text[start_idx:end_idx] if end_idx >= 0 else text[start_idx:]
     return [line.strip() for line in section.splitlines() if line.strip()]
 
 
@@ -96,26 +228,27 @@ def _normalize_symbol(code: str) -> str:
 
 
 def _huatai_account_id(text: str) -> str:
-    match = re.search(r"客户户口\s*:\s*(\d+)", text)
+    match = _RE_HUATAI_CLIENT.search(text)
     if match:
         return f"HTSC-{match.group(1)}"
     return "HTSC-UNKNOWN"
 
 
 def parse_huatai(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], List[Holding], str]:
-    account_id = _huatai_account_id(text)
+    account_id = sys.intern(_huatai_account_id(text))
     month = parse_statement_month(text)
     trades: List[Trade] = []
     seen_trade_refs: set[str] = set()
     seen_trade_keys: set[tuple] = set()
 
     # 成交单据
-    trade_lines = _extract_section_lines(text, "成交单据", ["户口变动", "持货结存"])
+    trade_lines = _extract_section_lines(text, *_HUATAI_TRADE_SECTION)
     for line in trade_lines:
-        if not re.match(r"^\d{8,}\s", line):
+        # Rows start with a reference of 8+ digits; lines are already stripped.
+        if not line[:8].isdigit():
             continue
         parts = line.split()
-        if len(parts) < 9:
+        if len(parts) < 9 or not parts[0].isdigit():
             continue
         ref = parts[0]
         settle = _parse_date(parts[1])
@@ -130,14 +263,7 @@ def parse_huatai(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], Lis
             continue
         if ":FUND" in code:
             continue
-        side_map = {
-            "买入": "BUY",
-            "买入开仓": "BUY",
-            "卖出": "SELL",
-            "沽出": "SELL",
-            "卖出平仓": "SELL",
-        }
-        side = side_map.get(side_cn)
+        side = _SIDE_MAP.get(side_cn)
         if side is None:
             continue
         trade_key = (account_id, _normalize_symbol(code), settle, side, abs(qty), price)
@@ -155,93 +281,103 @@ def parse_huatai(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], Lis
                 side=side,
                 qty=abs(qty),
                 price=price,
-                source=f"成交单据:{ref}",
+                source_kind="成交单据",
+                source_ref=ref,
             )
         )
 
-    # 户口变动 - 买卖交易
-    account_lines = _extract_section_lines(text, "户口变动", ["持货结存"])
-    pattern = re.compile(
-        r"^(?P<ref>\d{8,})\s+(?P<settle>\d{4}-\d{2}-\d{2})\s+"
-        r"(?P<trade>\d{4}-\d{2}-\d{2})\s+买卖交易\s+"
-        r"(?P<side>买入|沽出|卖出平仓|买入开仓|卖出)\s+(?P<code>[A-Z0-9]+:(?:HK|US))\s+"
-        r"(?P<name>.+?)\s+@(?P<price>[\d.]+)\s+(?P<qty>[\d,().-]+)"
-    )
+    # 户口变动: 买卖交易 and 现货存入 rows are told apart in a single pass.
+    # IPO buys are collected separately and appended after the regular trades.
+    account_lines = _extract_section_lines(text, *_HUATAI_ACCOUNT_SECTION)
+    ipo_trades: List[Trade] = []
     for line in account_lines:
-        if "买卖交易" not in line:
-            continue
-        if "取消" in line:
-            continue
-        match = pattern.search(line)
-        if not match:
-            continue
-        trade_date = _parse_date(match.group("trade"))
-        if not trade_date:
-            continue
-        side = "BUY" if match.group("side") in ("买入", "买入开仓") else "SELL"
-        code = match.group("code")
-        currency = _infer_currency_from_code(code)
-        if currency is None:
-            continue
-        price = _parse_number(match.group("price"))
-        qty = _parse_number(match.group("qty"))
-        if price is None or qty is None:
-            continue
-        trade_key = (account_id, _normalize_symbol(code), trade_date, side, abs(qty), price)
-        if match.group("ref") in seen_trade_refs or trade_key in seen_trade_keys:
-            continue
-        trades.append(
-            Trade(
-                account_id=account_id,
-                symbol=_normalize_symbol(code),
-                name=match.group("name").strip() if match.group("name") else None,
-                currency=currency,
-                trade_date=trade_date,
-                side=side,
-                qty=abs(qty),
-                price=price,
-                source=f"户口变动:{match.group('ref')}",
-            )
-        )
-
-    # 户口变动 - 现货存入（新股中签/配售等同买入）
-    ipo_pattern = re.compile(
-        r"^(?P<ref>[A-Z0-9]{8,})\s+(?P<settle>\d{4}-\d{2}-\d{2})"
-        r"(?:\s+\d{4}-\d{2}-\d{2})?\s+现货存入\s+"
-        r"(?P<code>\d{4,5})\s+(?P<name>.+?)\s+.*?@(?P<price>[\d.]+)\s+"
-        r"(?P<qty>[\d,]+)"
-    )
-    for line in account_lines:
-        if "现货存入" not in line:
-            continue
-        m = ipo_pattern.search(line)
-        if not m:
-            # Try lines without explicit @price (use amount/qty)
-            base_match = re.match(
-                r"^(?P<ref>[A-Z0-9]{8,})\s+(?P<settle>\d{4}-\d{2}-\d{2})"
-                r"(?:\s+\d{4}-\d{2}-\d{2})?\s+现货存入\s+"
-                r"(?P<code>\d{4,5})\s+(?P<rest>.+)$",
-                line,
-            )
-            if not base_match:
-                continue
-            rest = base_match.group("rest")
-            nums = re.findall(r"[\d,]+(?:\.\d+)?", rest)
-            if len(nums) < 2:
+        if "买卖交易" in line:
+            if "取消" in line:
                 continue
-            qty = _parse_number(nums[-2])
-            amount = _parse_number(nums[-1])
-            if not qty or not amount:
+            match = _RE_HUATAI_ACCOUNT.search(line)
+            if not match:
                 continue
-            price = amount / qty
-            trade_date = _parse_date(base_match.group("settle"))
+            trade_date = _parse_date(match.group("trade"))
             if not trade_date:
                 continue
-            code = base_match.group("code")
-            name = rest
-            # Trim trailing qty/amount from name
-            name = re.sub(r"[\d,]+(?:\.\d+)?\s+[\d,]+(?:\.\d+)?\s*$", "", name).strip()
+            side = _SIDE_MAP.get(match.group("side"))
+            if side is None:
+                continue
+            code = match.group("code")
+            currency = _infer_currency_from_code(code)
+            if currency is None:
+                continue
+            price = _parse_number(match.group("price"))
+            qty = _parse_number(match.group("qty"))
+            if price is None or qty is None:
+                continue
+            trade_key = (account_id, _normalize_symbol(code), trade_date, side, abs(qty), price)
+            if match.group("ref") in seen_trade_refs or trade_key in seen_trade_keys:
+                continue
             trades.append(
+                Trade(
+                    account_id=account_id,
+                    symbol=_normalize_symbol(code),
+                    name=match.group("name").strip() if match.group("name") else None,
+                    currency=currency,
+                    trade_date=trade_date,
+                    side=side,
+                    qty=abs(qty),
+                    price=price,
+                    source_kind="户口变动",
+                    source_ref=match.group("ref"),
+                )
+            )
+        elif "现货存入" in line:
+            # 现货存入（新股中签/配售等同买入）
+            m = _RE_IPO.search(line)
+            if not m:
+                # Try lines without explicit @price (use amount/qty)
+                base_match = _RE_IPO_BASE.match(line)
+                if not base_match:
+                    continue
+                rest = base_match.group("rest")
+                nums = _RE_NUMBER_TOKEN.findall(rest)
+                if len(nums) < 2:
+                    continue
+                qty = _parse_number(nums[-2])
+                amount = _parse_number(nums[-1])
+                if not qty or not amount:
+                    continue
+                price = amount / qty
+                trade_date = _parse_date(base_match.group("settle"))
+                if not trade_date:
+                    continue
+                code = base_match.group("code")
+                name = rest
+                # Trim trailing qty/amount from name
+                name = _RE_TRAILING_QTY_AMOUNT.sub("", name).strip()
+                ipo_trades.append(
+                    Trade(
+                        account_id=account_id,
+                        symbol=code,
+                        name=name,
+                        currency="HKD",
+                        trade_date=trade_date,
+                        side="BUY",
+                        qty=abs(qty),
+                        price=price,
+                        source_kind="现货存入",
+                        source_ref=base_match.group("ref"),
+                    )
+                )
+                continue
+            trade_date = _parse_date(m.group("settle"))
+            if not trade_date:
+                continue
+            code = m.group("code")
+            name = m.group("name").strip()
+            price = _parse_number(m.group("price"))
+            qty = _parse_number(m.group("qty"))
+            if price is None or qty is None:
+                continue
+            # Treat as HKD stock buy (new IPO/placement/allotment)
+            ipo_trades.append(
                 Trade(
                     account_id=account_id,
                     symbol=code,
@@ -251,36 +387,14 @@ def parse_huatai(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], Lis
                     side="BUY",
                     qty=abs(qty),
                     price=price,
-                    source=f"现货存入:{base_match.group('ref')}",
+                    source_kind="现货存入",
+                    source_ref=m.group("ref"),
                 )
             )
-            continue
-        trade_date = _parse_date(m.group("settle"))
-        if not trade_date:
-            continue
-        code = m.group("code")
-        name = m.group("name").strip()
-        price = _parse_number(m.group("price"))
-        qty = _parse_number(m.group("qty"))
-        if price is None or qty is None:
-            continue
-        # Treat as HKD stock buy (new IPO/placement/allotment)
-        trades.append(
-            Trade(
-                account_id=account_id,
-                symbol=code,
-                name=name,
-                currency="HKD",
-                trade_date=trade_date,
-                side="BUY",
-                qty=abs(qty),
-                price=price,
-                source=f"现货存入:{m.group('ref')}",
-            )
-        )
+    trades.extend(ipo_trades)
 
     holdings: List[Holding] = []
-    section_lines = _extract_section_lines(text, "持货结存", ["股票借贷资料", "重要提示"])
+    section_lines = _extract_section_lines(text, *_HUATAI_HOLDING_SECTION)
     currency = None
     for line in section_lines:
         if "HK - HONG KONG STOCK" in line:
@@ -294,28 +408,25 @@ def parse_huatai(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], Lis
             continue
         if currency not in ("HKD", "USD"):
             continue
-        if not re.match(r"^[A-Z0-9]", line):
+        if not _RE_NUM_START.match(line):
             continue
         tokens = line.split()
         if len(tokens) < 3:
             continue
         code = tokens[0].replace("*", "")
-        num_idx = None
-        for i in range(1, len(tokens)):
-            if _parse_number(tokens[i]) is not None:
-                num_idx = i
-                break
+        # The name runs up to the first numeric token; the closing quantity is
+        # the 4th number from there, whatever columns follow it.
+        values = [_parse_number(t) for t in tokens]
+        num_idx = next((i for i in range(1, len(values)) if values[i] is not None), None)
         if num_idx is None:
             continue
         name = " ".join(tokens[1:num_idx]).strip()
-        nums = [_parse_number(t) for t in tokens[num_idx:] if _parse_number(t) is not None]
+        nums = [v for v in values[num_idx:] if v is not None]
         if len(nums) < 4:
             continue
         net_qty = nums[3]
-        if net_qty is None:
-            continue
         # Filter to stocks only (skip options)
-        if re.search(r"\d{6,}[CP]\d{4,}", code):
+        if _RE_OPTION_SYM.search(code):
             continue
         holdings.append(
             Holding(account_id=account_id, symbol=code, currency=currency, qty=float(net_qty), name=name)
@@ -327,40 +438,39 @@ def parse_huatai(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], Lis
 def _normalize_duplicated(text: str) -> str:
     if not text:
         return text
-    out = []
-    prev = ""
-    for ch in text:
-        if ch == prev and not ch.isdigit() and ch not in ".,-()/":
-            continue
-        out.append(ch)
-        prev = ch
-    return "".join(out)
+    return _RE_DUP.sub(r"\1", text)
 
 
 def _merge_wrapped_lines(lines: List[str]) -> List[str]:
     merged: List[str] = []
-    buffer = ""
+    buffer: List[str] = []
+    # Open minus close parens across the buffered lines, kept incrementally.
+    balance = 0
     for line in lines:
         if buffer:
-            buffer = buffer + line
-            if buffer.count("(") <= buffer.count(")"):
-                merged.append(buffer)
-                buffer = ""
+            buffer.append(line)
+            balance += line.count("(") - line.count(")")
+            if balance <= 0:
+                merged.append("".join(buffer))
+                buffer = []
             continue
-        if re.search(r"(買入|賣出|賣出平倉)\s+[A-Z0-9.]+\([^)]*$", line):
-            buffer = line
+        if _RE_WRAPPED.search(line):
+            buffer = [line]
+            balance = line.count("(") - line.count(")")
             continue
         merged.append(line)
     if buffer:
-        merged.append(buffer)
+        merged.append("".join(buffer))
     return merged
 
 
+def _is_futu_stock(symbol: str) -> bool:
+    # Filter to stocks only (skip options)
+    return not (symbol.endswith((".US", ".HK")) or _RE_OPTION_SYM.search(symbol))
+
+
 def _futu_account_id(text: str) -> str:
-    match = re.search(r"賬戶號碼[:：]?\s*(\d{6,})", text)
-    if match:
-        return f"FUTU-{match.group(1)}"
-    match = re.search(r"帳戶號碼[:：]?\s*(\d{6,})", text)
+    match = _RE_FUTU_ACCT.search(text)
     if match:
         return f"FUTU-{match.group(1)}"
     return "FUTU-UNKNOWN"
@@ -368,10 +478,10 @@ def _futu_account_id(text: str) -> str:
 
 def parse_futu(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], List[Holding], str]:
     text = _normalize_duplicated(text)
-    account_id = _futu_account_id(text)
+    account_id = sys.intern(_futu_account_id(text))
 
     month = None
-    match = re.search(r"(\d{4})/(\d{2})", text)
+    match = _RE_FUTU_MONTH.search(text)
     if match:
         month = (int(match.group(1)), int(match.group(2)))
 
@@ -383,49 +493,49 @@ def parse_futu(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], List[
     current_symbol = None
     current_name = None
     current_side = None
+    # Only stock headers can yield trades; options/ADR lines skip the row regex.
+    current_is_stock = False
     for line in lines:
         if "交易--股票和股票期權" in line or "交易--股票和股票期权" in line:
             in_trades = True
             current_symbol = None
             current_name = None
             current_side = None
+            current_is_stock = False
             continue
         if in_trades and "交易--基金" in line:
             in_trades = False
             current_symbol = None
             current_name = None
             current_side = None
+            current_is_stock = False
             continue
         if not in_trades:
             continue
 
-        header_match = re.search(r"(買入|賣出|賣出平倉)\s+([A-Z0-9.]+)\(([^)]*)\)", line)
+        header_match = _RE_FUTU_HEADER.search(line)
         if header_match:
             current_side = "BUY" if header_match.group(1) == "買入" else "SELL"
             current_symbol = header_match.group(2)
             current_name = header_match.group(3).strip()
+            current_is_stock = _is_futu_stock(current_symbol)
             continue
-        header_partial = re.search(r"(買入|賣出|賣出平倉)\s+([A-Z0-9.]+)\(([^)]*)$", line)
+        header_partial = _RE_FUTU_HEADER_PARTIAL.search(line)
         if header_partial:
             current_side = "BUY" if header_partial.group(1) == "買入" else "SELL"
             current_symbol = header_partial.group(2)
             current_name = header_partial.group(3).strip()
+            current_is_stock = _is_futu_stock(current_symbol)
             continue
 
-        row_match = re.search(
-            r"(SEHK|US)\s+(HKD|USD|CNH|JPY|SGD)\s+"
-            r"(\d{4}/\d{2}/\d{2})\s+(\d{4}/\d{2}/\d{2})\s+"
-            r"([\d,]+)\s+([\d.]+)\s+([\d,]+(?:\.\d+)?)",
-            line,
-        )
-        if row_match and current_symbol and current_side:
+        if not current_is_stock:
+            continue
+        row_match = _RE_FUTU_ROW.search(line)
+        if row_match:
             trade_date = _parse_date(row_match.group(3), fmt="%Y/%m/%d")
             qty = _parse_number(row_match.group(5))
             price = _parse_number(row_match.group(6))
-            currency = row_match.group(2)
-            # Filter to stocks only (skip options)
-            if current_symbol.endswith((".US", ".HK")) or re.search(r"\d{6,}[CP]\d{4,}", current_symbol):
-                continue
+            currency = sys.intern(row_match.group(2))
             if trade_date and qty is not None and price is not None:
                 trades.append(
                     Trade(
@@ -437,7 +547,8 @@ def parse_futu(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], List[
                         side=current_side,
                         qty=abs(qty),
                         price=price,
-                        source=f"交易:{current_symbol}",
+                        source_kind="交易",
+                        source_ref=current_symbol,
                     )
                 )
 
@@ -454,16 +565,12 @@ def parse_futu(text: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], List[
             ["期初概覽--基金", "交易--股票和股票期權", "交易--股票和股票期权"],
         )
     for line in section_lines:
-        m = re.match(
-            r"^([A-Z0-9.]+)\(([^)]*)\)\s+(SEHK|US)\s+(HKD|USD|CNH|JPY|SGD)\s+"
-            r"([\d,]+)\s+([\d.]+)\s+-\s+([\d,]+(?:\.\d+)?)",
-            line,
-        )
+        m = _RE_FUTU_HOLDING.match(line)
         if not m:
             continue
         symbol = m.group(1)
         name = m.group(2)
-        currency = m.group(4)
+        currency = sys.intern(m.group(4))
         qty = _parse_number(m.group(5))
         if qty is None:
             continue
@@ -478,7 +585,7 @@ def parse_pdf(pdf_path: str) -> Tuple[Optional[Tuple[int, int]], List[Trade], Li
     pages = extract_text_pages(pdf_path)
     full_text = "\n".join(pages)
 
-    if "保證金綜合帳戶" in full_text or "證券月結單" in full_text:
+    if _detect_broker(full_text) == "futu":
         return parse_futu(full_text)
 
     return parse_huatai(full_text)
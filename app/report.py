@@ -1,11 +1,10 @@
 ﻿from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, List, NamedTuple, Optional
 
 from openpyxl import Workbook
 
 
-@dataclass
-class SummaryRow:
+class SummaryRow(NamedTuple):
     account_id: str
     symbol: str
     symbol_name: str
@@ -24,65 +23,50 @@ class SummaryRow:
     cost_missing_reason: Optional[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class WarningRow:
     account_id: str
     symbol: str
     message: str
 
 
+_SUMMARY_HEADER = (
+    "Account",
+    "Symbol",
+    "Name",
+    "Currency",
+    "Sell Proceeds",
+    "Cost Total",
+    "Realized Gain",
+    "Realized Loss",
+    "Net (Gain-Loss)",
+    "Tax Base",
+    "Tax Due (20%)",
+    "FX Rate (CNY)",
+    "Net (CNY)",
+    "Tax Due (CNY)",
+    "Cost Missing",
+    "Cost Missing Reason",
+)
+_WARNING_HEADER = ("Account", "Symbol", "Message")
+
+
 def build_workbook(
     rows: List[SummaryRow],
     warnings: List[WarningRow],
 ) -> Workbook:
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Summary"
-    ws.append(
-        [
-            "Account",
-            "Symbol",
-            "Name",
-            "Currency",
-            "Sell Proceeds",
-            "Cost Total",
-            "Realized Gain",
-            "Realized Loss",
-            "Net (Gain-Loss)",
-            "Tax Base",
-            "Tax Due (20%)",
-            "FX Rate (CNY)",
-            "Net (CNY)",
-            "Tax Due (CNY)",
-            "Cost Missing",
-            "Cost Missing Reason",
-        ]
-    )
+    # Write-only mode streams rows to the xlsx on save instead of holding a
+    # cell grid in memory; the returned workbook can only be saved once.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Summary")
+    ws.append(_SUMMARY_HEADER)
     for r in rows:
-        ws.append(
-            [
-                r.account_id,
-                r.symbol,
-                r.symbol_name,
-                r.currency,
-                r.proceeds,
-                r.cost_total,
-                r.gain,
-                r.loss,
-                r.net,
-                r.tax_base,
-                r.tax_due,
-                r.fx_rate,
-                r.net_cny,
-                r.tax_cny,
-                "YES" if r.cost_missing else "",
-                r.cost_missing_reason or "",
-            ]
-        )
+        # SummaryRow fields are in column order up to the two display columns.
+        ws.append((*r[:-2], "YES" if r.cost_missing else "", r.cost_missing_reason or ""))
 
     ws2 = wb.create_sheet("Warnings")
-    ws2.append(["Account", "Symbol", "Message"])
+    ws2.append(_WARNING_HEADER)
     for w in warnings:
-        ws2.append([w.account_id, w.symbol, w.message])
+        ws2.append((w.account_id, w.symbol, w.message))
 
     return wb
@@ -0,0 +1,100 @@
+"""Regenerate the PDF fixtures used by the parser tests.
+
+Needs reportlab, which the app itself does not depend on:
+
+    pip install reportlab && python tests/fixtures/make_fixtures.py
+"""
+import os
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen import canvas
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FONT = "STSong-Light"
+
+HEADER = ["华泰金融控股 月结单 (2025-03)", "客户户口 : 12345678", "成交单据"]
+TRADE_ROWS = [
+    ["10000001", "2025-03-03", "买入", "00700:HK", "300.5", "1,000", "x", "y", "z"],
+    ["10000002", "2025-03-05", "卖出", "00700:HK", "320.0", "400", "x", "y", "z"],
+]
+FOOTER = ["户口变动", "持货结存"]
+COLUMN_X = [40, 110, 190, 230, 300, 350, 410, 430, 450]
+
+
+HUATAI_FULL = [
+    [
+        "华泰金融控股 月结单 (2025-03)",
+        "客户户口 : 12345678",
+        "成交单据",
+        "10000001 2025-03-03 买入 00700:HK 300.5 1,000 x y z",
+        "户口变动",
+        "持货结存",
+        "HK - HONG KONG STOCK",
+        "00700 TENCENT 0 1,000 0 1,000 300.5",
+        "股票借贷资料",
+    ],
+    ["重要提示", "10000009 2025-03-20 买入 09988:HK 80.0 100 x y z"],
+]
+FUTU_TWO_TRADE_SECTIONS = [
+    [
+        "證券月結單 2025/04",
+        "賬戶號碼: 1234567890",
+        "交易--股票和股票期權",
+        "買入 00700(騰訊控股)",
+        "SEHK HKD 2025/04/02 2025/04/04 200 310.0 62,000.00",
+        "交易--基金",
+    ],
+    [
+        "交易--股票和股票期權",
+        "賣出 00700(騰訊控股)",
+        "SEHK HKD 2025/04/10 2025/04/14 100 320.0 32,000.00",
+    ],
+]
+
+
+def _canvas(path: str) -> canvas.Canvas:
+    pdfmetrics.registerFont(UnicodeCIDFont(FONT))
+    # invariant=1 keeps the output byte-identical across runs.
+    c = canvas.Canvas(path, invariant=1)
+    c.setFont(FONT, 10)
+    return c
+
+
+def make_text_pdf(path: str, pages: list) -> None:
+    c = _canvas(path)
+    for lines in pages:
+        c.setFont(FONT, 10)
+        y = 800
+        for line in lines:
+            c.drawString(40, y, line)
+            y -= 20
+        c.showPage()
+    c.save()
+
+
+def make_huatai_column_major(path: str) -> None:
+    # The 成交单据 table is drawn one column at a time, so the content stream
+    # order differs from the visual row order; only a layout-aware extractor
+    # rebuilds the rows.
+    c = _canvas(path)
+    y = 800
+    for line in HEADER:
+        c.drawString(40, y, line)
+        y -= 20
+    row_y = [y - 20 * i for i in range(len(TRADE_ROWS))]
+    for col, x in enumerate(COLUMN_X):
+        for row, ry in zip(TRADE_ROWS, row_y):
+            c.drawString(x, ry, row[col])
+    y = row_y[-1] - 20
+    for line in FOOTER:
+        c.drawString(40, y, line)
+        y -= 20
+    c.showPage()
+    c.save()
+
+
+if __name__ == "__main__":
+    make_huatai_column_major(os.path.join(HERE, "huatai_column_major.pdf"))
+    make_text_pdf(os.path.join(HERE, "huatai_trailing_page.pdf"), HUATAI_FULL)
+    make_text_pdf(os.path.join(HERE, "futu_two_trade_sections.pdf"), FUTU_TWO_TRADE_SECTIONS)
@@ -0,0 +1,141 @@
+import random
+from datetime import date
+
+from app.fifo import Lot, Realized, compute_realized
+from app.parser import Trade
+
+
+def _trade(symbol, day, side, qty, price):
+    return Trade(
+        account_id="A",
+        symbol=symbol,
+        name=None,
+        currency="USD",
+        trade_date=day,
+        side=side,
+        qty=qty,
+        price=price,
+        source_kind="成交单据",
+        source_ref="1",
+    )
+
+
+TRADES = [
+    # Listed out of date order on purpose; compute_realized sorts them.
+    _trade("X", date(2026, 2, 1), "SELL", 20.0, 12.0),  # oversells X after 2025
+    _trade("X", date(2025, 6, 1), "SELL", 15.0, 10.0),
+    _trade("X", date(2024, 3, 1), "BUY", 10.0, 6.0),
+    _trade("Y", date(2026, 5, 1), "SELL", 3.0, 9.0),  # only trade in Y, after 2025
+    _trade("Z", date(2024, 8, 1), "SELL", 2.0, 4.0),  # oversells Z before 2025
+    _trade("W", date(2025, 9, 1), "SELL", 4.0, 3.0),  # covered by the fallback cost
+]
+INITIAL_LOTS = {"X": [Lot(qty=10.0, cost=5.0)]}
+FALLBACK_COSTS = {"W": 5.0}
+OVERSELL = "Sell quantity exceeds available lots and no year-start average cost provided. Used 0 cost for remaining shares."
+
+
+def test_target_year_realizes_only_that_year_against_earlier_lots():
+    realized, _, _, sold = compute_realized(TRADES, INITIAL_LOTS, FALLBACK_COSTS, target_year=2025)
+
+    # 10 from the initial lot at 5, then 5 from the 2024 buy at 6.
+    assert realized["X"] == Realized(gain=70.0, loss=0.0, proceeds=150.0, cost=80.0)
+    assert realized["W"] == Realized(gain=0.0, loss=8.0, proceeds=12.0, cost=20.0)
+    assert realized["Z"] == Realized()
+    assert "Y" not in realized
+    assert sold == {"X", "W"}
+
+
+def test_target_year_drops_warnings_from_later_sells():
+    _, warnings, missing, _ = compute_realized(TRADES, INITIAL_LOTS, FALLBACK_COSTS, target_year=2025)
+
+    # Only the 2024 oversell of Z can affect 2025; X and Y oversell in 2026.
+    assert [(w.symbol, w.message) for w in warnings] == [("Z", OVERSELL)]
+    assert missing == {"Z"}
+
+
+def test_without_target_year_every_sell_is_realized_and_warned():
+    realized, warnings, missing, sold = compute_realized(TRADES, INITIAL_LOTS, FALLBACK_COSTS)
+
+    # The 2026 sell takes the last 5 of the 2024 lot at 6 and 15 shares at 0 cost.
+    assert realized["X"] == Realized(gain=70.0 + 30.0 + 180.0, loss=0.0, proceeds=390.0, cost=110.0)
+    assert realized["Y"] == Realized(gain=27.0, loss=0.0, proceeds=27.0, cost=0.0)
+    assert sorted(w.symbol for w in warnings) == ["X", "Y", "Z"]
+    assert missing == {"X", "Y", "Z"}
+    assert sold == {"X", "Y", "Z", "W"}
+
+
+def test_presorted_trades_give_the_same_result():
+    ordered = sorted(TRADES, key=lambda t: t.trade_date)
+    for target_year in (None, 2024, 2025, 2026):
+        assert compute_realized(ordered, INITIAL_LOTS, FALLBACK_COSTS, target_year, presorted=True) == compute_realized(
+            TRADES, INITIAL_LOTS, FALLBACK_COSTS, target_year
+        )
+
+
+def _reference_realized(trades, initial_lots, fallback_costs, target_year):
+    # Plain FIFO over every trade, as compute_realized worked before trades
+    # after the target year were cut: (symbol -> realized, oversold symbols
+    # in trade order, sold symbols).
+    lots = {sym: [[lot.qty, lot.cost] for lot in sym_lots] for sym, sym_lots in initial_lots.items()}
+    realized, oversold, sold = {}, [], set()
+    for t in sorted(trades, key=lambda t: t.trade_date):
+        open_lots = lots.setdefault(t.symbol, [])
+        r = realized.setdefault(t.symbol, Realized())
+        if t.side == "BUY":
+            open_lots.append([t.qty, t.price])
+            continue
+        in_year = target_year is None or t.trade_date.year == target_year
+        if in_year:
+            sold.add(t.symbol)
+        fills, remaining = [], t.qty
+        while remaining > 1e-9 and open_lots:
+            take = min(remaining, open_lots[0][0])
+            fills.append((take, open_lots[0][1]))
+            open_lots[0][0] -= take
+            remaining -= take
+            if open_lots[0][0] <= 1e-9:
+                open_lots.pop(0)
+        if remaining > 1e-9:
+            if t.symbol not in fallback_costs:
+                oversold.append((t.symbol, t.trade_date.year))
+            fills.append((remaining, fallback_costs.get(t.symbol, 0.0)))
+        for qty, cost in fills if in_year else ():
+            amount = (t.price - cost) * qty
+            r.gain += max(amount, 0.0)
+            r.loss += max(-amount, 0.0)
+            r.proceeds += t.price * qty
+            r.cost += cost * qty
+    return realized, oversold, sold
+
+
+def test_matches_reference_fifo_on_random_multi_year_trades():
+    rng = random.Random(7)
+    symbols = ["X", "Y", "Z"]
+    trades = [
+        _trade(
+            rng.choice(symbols),
+            date(2024 + i % 3, 1 + i % 12, 1 + i % 28),
+            rng.choice(["BUY", "BUY", "SELL"]),
+            float(rng.randint(1, 50)),
+            float(rng.randint(10, 100)),
+        )
+        for i in range(300)
+    ]
+    initial_lots = {"X": [Lot(qty=30.0, cost=5.0)]}
+    fallback_costs = {"Y": 7.0}
+
+    for target_year in (None, 2024, 2025, 2026):
+        realized, warnings, missing, sold = compute_realized(trades, initial_lots, fallback_costs, target_year)
+        ref_realized, ref_oversold, ref_sold = _reference_realized(trades, initial_lots, fallback_costs, target_year)
+
+        assert sold == ref_sold
+        for sym, r in realized.items():
+            ref = ref_realized[sym]
+            for field in ("gain", "loss", "proceeds", "cost"):
+                assert abs(getattr(r, field) - getattr(ref, field)) < 1e-6
+        # Symbols missing from realized only trade after the target year.
+        assert all(ref_realized[sym] == Realized() for sym in ref_realized.keys() - realized.keys())
+        # Oversells after the target year are no longer reported.
+        expected = [sym for sym, year in ref_oversold if target_year is None or year <= target_year]
+        assert sorted(w.symbol for w in warnings) == sorted(expected)
+        assert missing == set(expected)
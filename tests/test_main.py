@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture
+def fresh_pool():
+    main._PARSE_CACHE.clear()
+    main._shutdown_parse_pool()
+    yield
+    main._PARSE_CACHE.clear()
+    main._shutdown_parse_pool()
+
+
+def test_parse_statements_recovers_from_broken_pool(fresh_pool):
+    # A worker exiting abruptly, as on a native crash, breaks the shared pool.
+    pool = main._parse_pool()
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+
+    path = os.path.join(FIXTURES, "huatai_column_major.pdf")
+    (month, trades, holdings, account_id), = asyncio.run(main._parse_statements([path], ["digest"]))
+
+    assert account_id == "HTSC-12345678"
+    assert len(trades) == 2
+    assert main._PARSE_POOL is not pool
+
+
+def test_parse_pool_is_capped_and_does_not_fork_the_server(fresh_pool):
+    pool = main._parse_pool()
+
+    assert pool._max_workers == main.PARSE_WORKERS <= 4
+    assert pool._mp_context.get_start_method() == "forkserver"
+
+
+def test_lifespan_shuts_down_parse_pool(fresh_pool):
+    with TestClient(main.app):
+        main._parse_pool()
+        assert main._PARSE_POOL is not None
+    assert main._PARSE_POOL is None
+
+
+def _fixture_bytes(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+def _post_statements(client, *uploads):
+    files = [("statements", (name, _fixture_bytes(fixture), "application/pdf")) for name, fixture in uploads]
+    response = client.post("/process", files=files, data={"target_year": "2025"})
+    assert response.status_code == 200
+    return response.text
+
+
+def _cached_account(fixture):
+    return main._PARSE_CACHE[hashlib.sha256(_fixture_bytes(fixture)).hexdigest()][3]
+
+
+def test_uploads_sharing_a_filename_are_parsed_separately(fresh_pool):
+    huatai = "huatai_column_major.pdf"
+    futu = "futu_two_trade_sections.pdf"
+    with TestClient(main.app) as client:
+        _post_statements(client, ("statement.pdf", huatai), ("statement.pdf", futu))
+        assert _cached_account(huatai) == "HTSC-12345678"
+        assert _cached_account(futu) == "FUTU-1234567890"
+
+        # A later request is served from that cache; the Huatai sell must
+        # still show up under its own account.
+        html = _post_statements(client, ("a.pdf", huatai), ("b.pdf", futu))
+
+    assert '<option value="HTSC-12345678">' in html
+
+
+@pytest.fixture
+def report_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "REPORT_STORE", main.OrderedDict())
+    clock = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: clock[0])
+
+    def make_report(name):
+        report_dir = tmp_path / name
+        report_dir.mkdir()
+        path = report_dir / "tax_report_2025.xlsx"
+        path.write_bytes(name.encode())
+        return str(path)
+
+    return clock, make_report
+
+
+def test_expired_report_and_only_its_dir_are_removed(report_store, monkeypatch):
+    clock, make_report = report_store
+    monkeypatch.setattr(main, "REPORT_TTL_SECONDS", 60)
+    old_path, new_path = make_report("old"), make_report("new")
+
+    old_token = main._store_report(old_path)
+    clock[0] += 30
+    new_token = main._store_report(new_path)
+    clock[0] += 40
+
+    assert main._open_report(old_token) is None
+    assert not os.path.exists(os.path.dirname(old_path))
+    with main._open_report(new_token) as f:
+        assert f.read() == b"new"
+
+
+def test_size_cap_evicts_oldest_report_dir_only(report_store, monkeypatch):
+    _, make_report = report_store
+    monkeypatch.setattr(main, "REPORT_STORE_MAX", 2)
+    paths = [make_report(name) for name in ("r0", "r1", "r2")]
+
+    tokens = [main._store_report(path) for path in paths]
+
+    assert list(main.REPORT_STORE) == tokens[1:]
+    assert not os.path.exists(os.path.dirname(paths[0]))
+    assert all(os.path.exists(path) for path in paths[1:])
+
+
+def test_report_evicted_after_open_is_still_sent(report_store, monkeypatch):
+    _, make_report = report_store
+    monkeypatch.setattr(main, "REPORT_STORE_MAX", 1)
+    client = TestClient(main.app)
+    token = main._store_report(make_report("first"))
+
+    f = main._open_report(token)
+    second_token = main._store_report(make_report("second"))
+    with f:
+        assert f.read() == b"first"
+
+    assert client.get(f"/download/{token}").status_code == 404
+    response = client.get(f"/download/{second_token}")
+    assert response.status_code == 200
+    assert response.content == b"second"
+    assert response.headers["content-disposition"] == 'attachment; filename="tax_report_2025.xlsx"'
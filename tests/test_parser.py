@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+from app.parser import _futu_account_id, _parse_number, extract_text_pages, parse_huatai, parse_pdf
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def test_parse_pdf_rebuilds_rows_of_column_major_table():
+    # The 成交单据 table is drawn column by column; text taken in content
+    # stream order would put every value on its own line and lose both trades.
+    month, trades, holdings, account_id = parse_pdf(os.path.join(FIXTURES, "huatai_column_major.pdf"))
+
+    assert month == (2025, 3)
+    assert account_id == "HTSC-12345678"
+    assert [(t.source_ref, t.side, t.symbol, t.qty, t.price) for t in trades] == [
+        ("10000001", "BUY", "00700", 1000.0, 300.5),
+        ("10000002", "SELL", "00700", 400.0, 320.0),
+    ]
+    assert holdings == []
+
+
+def test_extract_text_pages_stops_after_huatai_sections_end():
+    # Page 2 carries a trade-like row after 重要提示; every section has ended
+    # on page 1, so it is never read.
+    path = os.path.join(FIXTURES, "huatai_trailing_page.pdf")
+
+    assert len(extract_text_pages(path)) == 1
+    month, trades, holdings, account_id = parse_pdf(path)
+    assert [t.source_ref for t in trades] == ["10000001"]
+    assert [(h.symbol, h.qty) for h in holdings] == [("00700", 1000.0)]
+
+
+def test_parse_pdf_reads_futu_trade_sections_after_fund_heading():
+    # A second 交易--股票和股票期權 section follows 交易--基金 on the next page.
+    month, trades, holdings, account_id = parse_pdf(os.path.join(FIXTURES, "futu_two_trade_sections.pdf"))
+
+    assert account_id == "FUTU-1234567890"
+    assert [(t.side, t.symbol, t.qty, t.trade_date.isoformat()) for t in trades] == [
+        ("BUY", "00700", 200.0, "2025-04-02"),
+        ("SELL", "00700", 100.0, "2025-04-10"),
+    ]
+
+
+def _huatai_holdings(*rows):
+    text = "\n".join(["华泰金融控股 月结单 (2025-03)", "客户户口 : 12345678", "持货结存", "HK - HONG KONG STOCK", *rows])
+    return [(h.symbol, h.name, h.qty) for h in parse_huatai(text)[2]]
+
+
+def test_huatai_holdings_take_closing_qty_from_left_of_numeric_run():
+    assert _huatai_holdings(
+        "00700* TENCENT HOLDINGS 1,000 0 (400) 600 300.1",
+        "00700 TENCENT 100 0 0 100 380.00 38000.00",
+        "00700 TENCENT 100 0 0 100",
+    ) == [
+        ("00700", "TENCENT HOLDINGS", 600.0),
+        ("00700", "TENCENT", 100.0),
+        ("00700", "TENCENT", 100.0),
+    ]
+
+
+def test_huatai_holdings_skip_rows_with_fewer_than_four_numbers():
+    assert _huatai_holdings("00700 TENCENT 100 0 0") == []
+
+
+@pytest.mark.parametrize(
+    "token, expected",
+    [
+        ("1,000", 1000.0),
+        ("(400)", -400.0),
+        ("-3.5", -3.5),
+        ("+2", 2.0),
+        (".5", 0.5),
+        ("5.", 5.0),
+        (" (1,234.5) ", -1234.5),
+    ],
+)
+def test_parse_number_accepts_statement_numbers(token, expected):
+    assert _parse_number(token) == expected
+
+
+@pytest.mark.parametrize("token", ["", "TENCENT", "-", ".", "()", "1e3", "inf", "NAN", "1_000", "(5", "1.2.3"])
+def test_parse_number_rejects_non_statement_numbers(token):
+    # float() accepts exponents, inf/nan and underscores; statements never use them.
+    assert _parse_number(token) is None
+
+
+def test_huatai_holdings_name_may_contain_nan():
+    assert _huatai_holdings("00700 NAN HOLDINGS 100 0 0 100 380.00") == [("00700", "NAN HOLDINGS", 100.0)]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("證券月結單\n賬戶號碼: 1234567890", "FUTU-1234567890"),
+        ("證券月結單\n帳戶號碼：7654321", "FUTU-7654321"),
+        ("帳戶號碼 1111111\n賬戶號碼 2222222", "FUTU-1111111"),
+        ("賬戶號碼: 12345", "FUTU-UNKNOWN"),
+        ("證券月結單", "FUTU-UNKNOWN"),
+    ],
+)
+def test_futu_account_id(text, expected):
+    # Both spellings are matched in one scan; the first one in the text wins.
+    assert _futu_account_id(text) == expected